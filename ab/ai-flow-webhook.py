@@ -1,43 +1,139 @@
 #!/usr/bin/env python3
 """sipgate AI Flow webhook — Anrufbeantworter für YuzuHub."""
+import functools
+import hmac
+import http.client
 import json
 import os
-import urllib.request
-from http.server import HTTPServer, BaseHTTPRequestHandler
+import queue
+import signal
+import time
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
 from datetime import datetime
-from threading import Lock
+from threading import Lock, Thread
 
 PORT = int(os.environ.get("FLOW_PORT", 8788))
 SECRET = os.environ.get("FLOW_SECRET", "")
+MAX_BODY = 64 * 1024  # sipgate events are a few KB at most
 
 # Clawdbot hook config for notifications
 CLAWDBOT_HOOK_URL = "http://127.0.0.1:18789/hooks/wake"
 CLAWDBOT_HOOK_TOKEN = os.environ.get("CLAWDBOT_TOKEN", "d4758672a4163db5f252a0fea602c2c89df93f1670a52d9f")
 
+# Parse the hook URL once and keep one persistent connection to Clawdbot
+_hook = urlsplit(CLAWDBOT_HOOK_URL)
+CLAWDBOT_HOST = _hook.hostname
+CLAWDBOT_PORT = _hook.port or 80
+CLAWDBOT_PATH = _hook.path or "/"
+CLAWDBOT_HEADERS = {
+    "Content-Type": "application/json",
+    "Authorization": f"Bearer {CLAWDBOT_HOOK_TOKEN}"
+}
+_conn = http.client.HTTPConnection(CLAWDBOT_HOST, CLAWDBOT_PORT, timeout=5)
+_conn_lock = Lock()
+NOTIFY_BACKOFF = (1, 2, 5)  # seconds to wait between attempts
+NOTIFY_ATTEMPTS = 3
+
 GREETING = (
     "Hallo, hier ist der Anrufbeantworter von YuzuHub. "
     "Wir sind gerade nicht erreichbar. "
     "Bitte hinterlasse eine Nachricht nach dem Signalton, und wir melden uns bei dir."
 )
 
-# Load beep sound (base64 WAV)
+# Beep sound (base64 WAV), loaded on first use
 BEEP_FILE = os.path.join(os.path.dirname(__file__), "beep.b64")
-try:
-    with open(BEEP_FILE) as f:
-        BEEP_AUDIO = f.read().strip()
-except FileNotFoundError:
-    BEEP_AUDIO = None
 
 THANKS = "Danke für deine Nachricht. Wir melden uns so bald wie möglich. Tschüss!"
+PROMPT = "Hallo? Wenn du eine Nachricht hinterlassen möchtest, sprich einfach los."
+
+
+def action_template(action_type, **fields):
+    """Pre-serialize a static action; only session_id is spliced in per call.
+
+    Returns (label, template); the label is what gets logged instead of the raw JSON.
+    """
+    body = json.dumps({"type": action_type, "session_id": None, **fields})
+    label = f"{action_type}: {fields.get('text', '')[:80]}"
+    return label, body.replace("%", "%%").replace('"session_id": null', '"session_id": %s').encode()
+
+
+def fill(template, session_id):
+    """(label, response body) for one session."""
+    label, body = template
+    return label, body % json.dumps(session_id).encode()
+
+
+GREETING_RESP = action_template("speak", text=GREETING, user_input_timeout_seconds=30)
+THANKS_RESP = action_template("speak", text=THANKS)
+PROMPT_RESP = action_template("speak", text=PROMPT, user_input_timeout_seconds=15)
+
+
+@functools.lru_cache(maxsize=None)
+def beep_response():
+    """Finished audio action template with the beep pre-escaped, or None without beep file."""
+    try:
+        with open(BEEP_FILE) as f:
+            audio = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return action_template("audio", audio=audio)
 
 # Store messages per session
 sessions = {}
 sessions_lock = Lock()
+SESSION_MAX_AGE = 30 * 60  # drop sessions idle this long (missed session_end)
+REAP_INTERVAL = 300
+
+# Notifications are sent by a background worker so webhook replies never wait on Clawdbot
+_notify_q = queue.Queue()
+SHUTDOWN_DRAIN = 30  # seconds to keep sending queued notifications on exit (one retry cycle ≈ 18s)
+
+
+def queue_notify(caller, messages):
+    """Hand a notification to the background worker and return immediately."""
+    _notify_q.put((caller, list(messages), datetime.now()))
 
 
-def notify_clawdbot(caller, messages):
+def _notify_worker():
+    while True:
+        caller, messages, when = _notify_q.get()
+        try:
+            notify_clawdbot(caller, messages, when)
+        finally:
+            _notify_q.task_done()
+
+
+def drain_notifications(timeout):
+    """Wait up to timeout seconds for queued notifications; returns how many are left."""
+    deadline = time.monotonic() + timeout
+    with _notify_q.all_tasks_done:
+        while _notify_q.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            _notify_q.all_tasks_done.wait(remaining)
+        return _notify_q.unfinished_tasks
+
+
+def _reap_sessions():
+    """Evict sessions whose session_end never arrived, notifying for unsent messages."""
+    while True:
+        time.sleep(REAP_INTERVAL)
+        now = time.monotonic()
+        with sessions_lock:
+            stale = [sid for sid, d in sessions.items() if now - d.get("last_seen", 0) > SESSION_MAX_AGE]
+            reaped = [sessions.pop(sid) for sid in stale]
+        for data in reaped:
+            if data["messages"] and not data.get("thanked"):
+                queue_notify(data["caller"], data["messages"])
+        if reaped:
+            print(f"  🧹 {len(reaped)} verwaiste Session(s) entfernt", flush=True)
+
+
+def notify_clawdbot(caller, messages, when=None):
     """Notify via Clawdbot hook so Chadd can forward to Stefan/Verena."""
-    timestamp = datetime.now().strftime("%H:%M")
+    timestamp = (when or datetime.now()).strftime("%H:%M")
     msg_text = "\n".join(f"  > {m}" for m in messages) if messages else "  (keine Nachricht hinterlassen)"
     
     text = (
@@ -48,34 +144,69 @@ def notify_clawdbot(caller, messages):
     )
     
     payload = json.dumps({"text": text, "mode": "now"}).encode()
-    req = urllib.request.Request(
-        CLAWDBOT_HOOK_URL,
-        data=payload,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {CLAWDBOT_HOOK_TOKEN}"
-        },
-        method="POST"
-    )
-    try:
-        with urllib.request.urlopen(req, timeout=5) as resp:
-            print(f"  Clawdbot notified ({resp.status})", flush=True)
-    except Exception as e:
-        print(f"  Clawdbot notify failed: {e}", flush=True)
+    for attempt in range(1, NOTIFY_ATTEMPTS + 1):
+        try:
+            status = post_clawdbot(payload)
+            if status < 500:
+                print(f"  Clawdbot notified ({status}, attempt {attempt})", flush=True)
+                return
+            error = f"HTTP {status}"
+        except Exception as e:
+            error = e
+        print(f"  Clawdbot notify failed (attempt {attempt}/{NOTIFY_ATTEMPTS}): {error}", flush=True)
+        if attempt < NOTIFY_ATTEMPTS:
+            time.sleep(NOTIFY_BACKOFF[min(attempt, len(NOTIFY_BACKOFF)) - 1])
+
+
+def post_clawdbot(payload):
+    """POST payload over the shared connection; reconnect once if it went stale."""
+    with _conn_lock:
+        for attempt in range(2):
+            try:
+                _conn.request("POST", CLAWDBOT_PATH, payload, CLAWDBOT_HEADERS)
+                resp = _conn.getresponse()
+                resp.read()
+                return resp.status
+            except (BrokenPipeError, ConnectionResetError):
+                _conn.close()
+                if attempt:
+                    raise
+            except Exception:
+                _conn.close()
+                raise
 
 
 class FlowHandler(BaseHTTPRequestHandler):
     def do_POST(self):
-        length = int(self.headers.get("Content-Length", 0))
-        body = self.rfile.read(length)
-
+        # Authenticate before touching the body; unauthenticated requests are
+        # never read (the HTTP/1.0 handler closes the connection afterwards)
         if SECRET:
             token = self.headers.get("X-API-TOKEN", "")
-            if token != SECRET:
+            if not hmac.compare_digest(token.encode(), SECRET.encode()):
                 self.send_response(401)
                 self.end_headers()
                 return
 
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_response(400)
+            self.end_headers()
+            return
+        if length > MAX_BODY:
+            self.send_response(413)
+            self.end_headers()
+            return
+
+        body = self.read_body(length)
+        if body is None:
+            # Client sent less than Content-Length promised
+            self.send_response(400)
+            self.end_headers()
+            return
+
         try:
             event = json.loads(body)
         except json.JSONDecodeError:
@@ -90,16 +221,28 @@ class FlowHandler(BaseHTTPRequestHandler):
         action = self.handle_event(event)
 
         if action:
+            label, body = action
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.end_headers()
-            self.wfile.write(json.dumps(action).encode())
-            text = action.get("text", "")[:80]
-            print(f"  → {action.get('type', '?')}: {text}", flush=True)
+            self.wfile.write(body)
+            print(f"  → {label}", flush=True)
         else:
             self.send_response(204)
             self.end_headers()
 
+    def read_body(self, length):
+        """Read exactly length bytes into one preallocated buffer, or None if truncated."""
+        buf = bytearray(length)
+        view = memoryview(buf)
+        got = 0
+        while got < length:
+            n = self.rfile.readinto(view[got:])
+            if not n:
+                return None
+            got += n
+        return buf
+
     def handle_event(self, event):
         event_type = event.get("type", "")
         session = event.get("session", {})
@@ -114,15 +257,11 @@ class FlowHandler(BaseHTTPRequestHandler):
                 sessions[session_id] = {
                     "caller": caller,
                     "messages": [],
-                    "beeped": False
+                    "beeped": False,
+                    "last_seen": time.monotonic()
                 }
 
-            return {
-                "type": "speak",
-                "session_id": session_id,
-                "text": GREETING,
-                "user_input_timeout_seconds": 30
-            }
+            return fill(GREETING_RESP, session_id)
 
         elif event_type == "user_speak":
             text = event.get("text", "").strip()
@@ -131,6 +270,7 @@ class FlowHandler(BaseHTTPRequestHandler):
             with sessions_lock:
                 if session_id not in sessions:
                     sessions[session_id] = {"caller": "unbekannt", "messages": []}
+                sessions[session_id]["last_seen"] = time.monotonic()
                 if text:
                     sessions[session_id]["messages"].append(text)
 
@@ -138,59 +278,51 @@ class FlowHandler(BaseHTTPRequestHandler):
             return None
 
         elif event_type == "user_input_timeout":
-            # Caller stopped talking — wrap up
+            # Caller stopped talking — wrap up. Snapshot and mark thanked in one
+            # lock hold; the notify happens outside it.
             with sessions_lock:
                 if session_id not in sessions:
                     sessions[session_id] = {"caller": "unbekannt", "messages": []}
                 data = sessions[session_id]
-                messages = data.get("messages", [])
-                already_thanked = data.get("thanked", False)
-
-            if messages and not already_thanked:
-                with sessions_lock:
-                    sessions[session_id]["thanked"] = True
-                notify_clawdbot(data.get("caller", "unbekannt"), messages)
-                return {
-                    "type": "speak",
-                    "session_id": session_id,
-                    "text": THANKS
-                }
+                data["last_seen"] = time.monotonic()
+                messages = list(data["messages"])
+                caller = data["caller"]
+                thank = bool(messages) and not data.get("thanked", False)
+                if thank:
+                    data["thanked"] = True
+
+            if thank:
+                queue_notify(caller, messages)
+                return fill(THANKS_RESP, session_id)
             elif not messages:
-                return {
-                    "type": "speak",
-                    "session_id": session_id,
-                    "text": "Hallo? Wenn du eine Nachricht hinterlassen möchtest, sprich einfach los.",
-                    "user_input_timeout_seconds": 15
-                }
+                return fill(PROMPT_RESP, session_id)
             return None
 
         elif event_type == "session_end":
             print("  📞 Anruf beendet.", flush=True)
+            # Once popped the session is ours alone — read it outside the lock
             with sessions_lock:
                 data = sessions.pop(session_id, {})
-                messages = data.get("messages", [])
-                caller = data.get("caller", "unbekannt")
-                already_thanked = data.get("thanked", False)
 
-            if not already_thanked:
-                notify_clawdbot(caller, messages)
+            if not data.get("thanked", False):
+                queue_notify(data.get("caller", "unbekannt"), data.get("messages", []))
             return None
 
         elif event_type == "assistant_speak":
             return None
 
         elif event_type == "assistant_speech_ended":
-            # Play beep after greeting
+            # Play beep after greeting. The first beep_response() reads and
+            # encodes the beep file, so do it before taking the lock.
+            template = beep_response()
             with sessions_lock:
                 data = sessions.get(session_id, {})
-                if not data.get("beeped") and BEEP_AUDIO:
+                if data:
+                    data["last_seen"] = time.monotonic()
+                beep = bool(template) and not data.get("beeped")
+                if beep:
                     data["beeped"] = True
-                    return {
-                        "type": "audio",
-                        "session_id": session_id,
-                        "audio": BEEP_AUDIO
-                    }
-            return None
+            return fill(template, session_id) if beep else None
 
         return None
 
@@ -198,8 +330,16 @@ class FlowHandler(BaseHTTPRequestHandler):
         pass
 
 
+def _raise_interrupt(*_):
+    raise KeyboardInterrupt
+
+
 def main():
-    server = HTTPServer(("0.0.0.0", PORT), FlowHandler)
+    # Service stops send SIGTERM: take the same drain-then-exit path as Ctrl-C
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    Thread(target=_notify_worker, daemon=True).start()
+    Thread(target=_reap_sessions, daemon=True).start()
+    server = ThreadingHTTPServer(("0.0.0.0", PORT), FlowHandler)
     print(f"🍋 YuzuHub Anrufbeantworter läuft auf Port {PORT}", flush=True)
     print(f"   Endpoint: http://0.0.0.0:{PORT}/", flush=True)
     try:
@@ -207,6 +347,10 @@ def main():
     except KeyboardInterrupt:
         print("\nBeendet.")
         server.server_close()
+        # Queued session_end notifications are voicemails — don't drop them on exit
+        left = drain_notifications(SHUTDOWN_DRAIN)
+        if left:
+            print(f"  ⚠️ {left} Benachrichtigung(en) nicht gesendet", flush=True)
 
 
 if __name__ == "__main__":
@@ -1,18 +1,30 @@
 #!/usr/bin/env python3
 """Bluesky Auto-Poster — checks queue for approved posts/replies and publishes them.
 
-Runs via crontab every 10 minutes. Self-contained, no session tokens needed.
+Runs via crontab every 10 minutes, or as a long-lived process with --daemon
+(polls every POLL_INTERVAL seconds, keeps the Bluesky client and HTTP connections
+open; stop with SIGTERM). The Bluesky session is shared with bsky-post.py via
+chadd_bsky and only re-created with handle/password when it is rejected.
 Respects: max 1 standalone post/day, no posting 23:00-08:00, replies anytime (during waking hours).
 Notifies via Clawdbot webhook after each post.
 """
 
+import argparse
 import json
 import os
+import signal
 import sys
+import threading
+import time
 import requests
+from requests.adapters import HTTPAdapter
 from datetime import datetime, timezone, timedelta
 from pathlib import Path
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+import chadd_bsky
+
 # Config
 DASHBOARD_URL = "http://localhost:8790"
 DASHBOARD_PIN = "yuzu2026"
@@ -20,34 +32,65 @@ STATE_FILE = Path(__file__).parent / "autoposter-state.json"
 ENV_FILE = Path.home() / ".chadd-mail.env"
 BERLIN = timezone(timedelta(hours=1))  # CET (simplified, no DST handling)
 
-def load_env():
-    env = {}
-    if ENV_FILE.exists():
-        for line in ENV_FILE.read_text().splitlines():
-            line = line.strip()
-            if "=" in line and not line.startswith("#"):
-                k, v = line.split("=", 1)
-                env[k.strip()] = v.strip().strip('"').strip("'")
-    return env
+# One keep-alive session for all dashboard/Clawdbot calls in a run
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(pool_connections=4, pool_maxsize=4, max_retries=0))
+SESSION.headers.update({"Connection": "keep-alive"})
+
+NOTIFY_URL = "http://localhost:3377/api/notify"
+ROOT_CACHE_MAX_AGE = 30 * 24 * 3600  # seconds a cached parent → root ref is kept
+POLL_INTERVAL = 60  # seconds between queue checks in --daemon mode
+
+_client = None  # logged-in atproto client, reused across daemon iterations
 
 def load_state():
     if STATE_FILE.exists():
-        return json.loads(STATE_FILE.read_text())
+        state = json.loads(STATE_FILE.read_text())
+        # Session tokens now live in chadd_bsky.SESSION_CACHE; drop old copies
+        state.pop('bsky_session', None)
+        return state
     return {"last_post_date": None, "posts_today": 0}
 
 def save_state(state):
-    STATE_FILE.write_text(json.dumps(state, indent=2))
+    # Older versions kept session tokens here, so owner-only (fchmod also fixes those files)
+    fd = os.open(STATE_FILE, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    os.fchmod(fd, 0o600)
+    with os.fdopen(fd, "w") as f:
+        f.write(json.dumps(state, indent=2))
+
+def _post_with_retry(session, url, attempts=3, backoff=(1, 2, 5), **kw):
+    """POST with bounded exponential backoff. Returns the response, or None if all attempts failed."""
+    for attempt in range(1, attempts + 1):
+        try:
+            r = session.post(url, **kw)
+            if r.status_code == 200:
+                return r
+            error = f"HTTP {r.status_code}"
+        except requests.RequestException as e:
+            error = e
+        print(f"POST {url} failed (attempt {attempt}/{attempts}): {error}")
+        if attempt < attempts:
+            time.sleep(backoff[min(attempt, len(backoff)) - 1])
+    return None
+
+def prune_root_cache(root_cache):
+    """Drop root refs older than ROOT_CACHE_MAX_AGE (threads go quiet long before that)."""
+    cutoff = time.time() - ROOT_CACHE_MAX_AGE
+    for uri in [u for u, e in root_cache.items() if e.get('ts', 0) < cutoff]:
+        del root_cache[uri]
 
 def is_quiet_hours():
     now = datetime.now(BERLIN)
     return now.hour >= 23 or now.hour < 8
 
-def get_next_approved(post_type=None, skip_type=None):
+def get_next_approved(post_type=None, skip_type=None, state=None):
     """Get next approved post from dashboard API.
     
     Args:
         post_type: filter to only this type ('post' or 'reply')
         skip_type: exclude this type
+        state: autoposter state; if given, the ETag of the last empty answer is
+            sent as If-None-Match so an unchanged queue short-circuits with 304
     """
     try:
         params = {"token": DASHBOARD_PIN}
@@ -55,9 +98,18 @@ def get_next_approved(post_type=None, skip_type=None):
             params["type"] = post_type
         if skip_type:
             params["skip_type"] = skip_type
-        r = requests.get(f"{DASHBOARD_URL}/api/next", params=params, timeout=5)
+        headers = {}
+        if state is not None and state.get("next_etag"):
+            headers["If-None-Match"] = state["next_etag"]
+        r = SESSION.get(f"{DASHBOARD_URL}/api/next", params=params, headers=headers, timeout=5)
+        if r.status_code == 304:
+            return None
         if r.status_code == 200:
             data = r.json()
+            # Only remember the ETag for "nothing approved" — a post we skipped
+            # (e.g. daily limit) must still be returned on the next run.
+            if state is not None:
+                state["next_etag"] = None if data else r.headers.get("ETag")
             return data if data else None
     except Exception as e:
         print(f"Dashboard unreachable: {e}")
@@ -69,16 +121,20 @@ def mark_posted(post_id, post_uri=None):
         params = {"token": DASHBOARD_PIN}
         if post_uri:
             params["post_uri"] = post_uri
-        requests.post(f"{DASHBOARD_URL}/api/mark-posted/{post_id}", params=params, timeout=5)
+        SESSION.post(f"{DASHBOARD_URL}/api/mark-posted/{post_id}", params=params, timeout=5)
     except Exception as e:
         print(f"Failed to mark posted: {e}")
 
-def publish_post(env, post):
-    """Publish a post or reply to Bluesky."""
-    from atproto import Client
+def get_client(env):
+    """Logged-in atproto client, kept for the life of the process."""
+    global _client
+    if _client is None:
+        _client = chadd_bsky.get_client(env['BSKY_HANDLE'], env['BSKY_PASS'])
+    return _client
 
-    client = Client()
-    client.login(env['BSKY_HANDLE'], env['BSKY_PASS'])
+def publish_post(env, post, state):
+    """Publish a post or reply to Bluesky."""
+    client = get_client(env)
 
     text = post['text']
     post_type = post.get('type', 'post')
@@ -90,20 +146,32 @@ def publish_post(env, post):
         parent_uri = reply_to['uri']
         parent_cid = reply_to['cid']
 
-        # Get the parent post to check if it's itself a reply (need root ref)
-        try:
-            thread = client.get_post_thread(uri=parent_uri, depth=0)
-            parent_post = thread.thread.post
-            # If parent is a reply, use its root; otherwise parent IS the root
-            if hasattr(parent_post, 'record') and hasattr(parent_post.record, 'reply') and parent_post.record.reply:
-                root_uri = parent_post.record.reply.root.uri
-                root_cid = parent_post.record.reply.root.cid
-            else:
+        # Root ref: from the queue entry, else the root cache, else the parent's thread
+        root_cache = state.setdefault('root_cache', {})
+        cached = root_cache.get(parent_uri)
+        if reply_to.get('root_uri') and reply_to.get('root_cid'):
+            root_uri = reply_to['root_uri']
+            root_cid = reply_to['root_cid']
+        elif cached:
+            root_uri = cached['uri']
+            root_cid = cached['cid']
+        else:
+            # Get the parent post to check if it's itself a reply (need root ref)
+            try:
+                thread = client.get_post_thread(uri=parent_uri, depth=0)
+                parent_post = thread.thread.post
+                # If parent is a reply, use its root; otherwise parent IS the root
+                if hasattr(parent_post, 'record') and hasattr(parent_post.record, 'reply') and parent_post.record.reply:
+                    root_uri = parent_post.record.reply.root.uri
+                    root_cid = parent_post.record.reply.root.cid
+                else:
+                    root_uri = parent_uri
+                    root_cid = parent_cid
+                root_cache[parent_uri] = {'uri': root_uri, 'cid': root_cid, 'ts': time.time()}
+                prune_root_cache(root_cache)
+            except:
                 root_uri = parent_uri
                 root_cid = parent_cid
-        except:
-            root_uri = parent_uri
-            root_cid = parent_cid
 
         # Create strong refs properly
         parent_ref = models.ComAtprotoRepoStrongRef.Main(uri=parent_uri, cid=parent_cid)
@@ -131,28 +199,21 @@ def notify_stefan(env, post, post_uri):
         msg += f"\n\nhttps://bsky.app/profile/chadd-yuzu.bsky.social/post/{rkey}"
 
     # Try to notify via local Clawdbot API
-    try:
-        r = requests.post("http://localhost:3377/api/notify", json={"message": msg}, timeout=5)
-        if r.status_code == 200:
-            return
-    except:
-        pass
+    if _post_with_retry(SESSION, NOTIFY_URL, json={"message": msg}, timeout=5) is not None:
+        return
 
-    # Fallback: write to a notification file that heartbeat can pick up
+    # Fallback: append to a notification file that heartbeat can pick up
     notif_file = Path(__file__).parent / "pending-notification.txt"
-    notif_file.write_text(msg)
+    with notif_file.open("a") as f:
+        f.write(f"[{datetime.now(BERLIN).isoformat(timespec='seconds')}]\n{msg}\n\n")
     print(f"Notification saved to {notif_file}")
 
-def main():
+def run_once(env, state):
+    """One queue check. Returns False if publishing failed."""
+    global _client
     if is_quiet_hours():
-        return
-
-    env = load_env()
-    if 'BSKY_HANDLE' not in env:
-        print("Missing BSKY credentials")
-        sys.exit(1)
+        return True
 
-    state = load_state()
     today = datetime.now(BERLIN).strftime("%Y-%m-%d")
 
     # Reset daily counter if new day
@@ -162,9 +223,12 @@ def main():
         save_state(state)
 
     # Try to get next approved post
-    post = get_next_approved()
+    etag = state.get('next_etag')
+    post = get_next_approved(state=state)
+    if state.get('next_etag') != etag:
+        save_state(state)
     if not post:
-        return
+        return True
 
     post_type = post.get('type', 'post')
 
@@ -174,11 +238,11 @@ def main():
         post = get_next_approved(post_type='reply')
         if not post:
             print("No replies in queue either.")
-            return
+            return True
         post_type = 'reply'
 
     try:
-        post_uri = publish_post(env, post)
+        post_uri = publish_post(env, post, state)
         print(f"Published: {post_uri}")
 
         mark_posted(post['id'], post_uri)
@@ -190,8 +254,42 @@ def main():
         notify_stefan(env, post, post_uri)
 
     except Exception as e:
+        _client = None  # log in afresh next time in case the session went bad
         print(f"Publish failed: {e}")
+        return False
+    return True
+
+def run_daemon(env, state):
+    """Poll the queue until SIGTERM/SIGINT."""
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stop.set())
+    signal.signal(signal.SIGINT, lambda *_: stop.set())
+    print(f"Auto-poster running, checking every {POLL_INTERVAL}s", flush=True)
+    while not stop.is_set():
+        try:
+            run_once(env, state)
+        except Exception as e:
+            print(f"Run failed: {e}", flush=True)
+        stop.wait(POLL_INTERVAL)
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish approved posts from the dashboard queue")
+    parser.add_argument("--daemon", action="store_true", help="keep running and poll every POLL_INTERVAL seconds")
+    args = parser.parse_args()
+
+    env = load_env(ENV_FILE)
+    if 'BSKY_HANDLE' not in env:
+        print("Missing BSKY credentials")
         sys.exit(1)
 
+    state = load_state()
+    try:
+        if args.daemon:
+            run_daemon(env, state)
+        elif not run_once(env, state):
+            sys.exit(1)
+    finally:
+        SESSION.close()
+
 if __name__ == "__main__":
     main()
@@ -3,14 +3,22 @@
 
 import json
 import os
+import sys
 import uuid
 import secrets
+import stat
+import tempfile
+import threading
 from datetime import datetime
 from pathlib import Path
 from functools import wraps
-from flask import Flask, request, jsonify, render_template_string, redirect, url_for, session
+from flask import Flask, request, jsonify, redirect, url_for, session
 
-app = Flask(__name__)
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+
+app = Flask(__name__, static_folder="static")
+app.config["SEND_FILE_MAX_AGE_DEFAULT"] = 86400  # let browsers cache the CSS
 app.secret_key = secrets.token_hex(32)
 
 QUEUE_FILE = Path(__file__).parent / "bsky-queue.json"
@@ -19,21 +27,10 @@ ENV_FILE = Path.home() / ".chadd-mail.env"
 # Simple password auth
 DASHBOARD_PIN = None
 
-def load_env():
-    """Load env vars from ~/.chadd-mail.env"""
-    env = {}
-    if ENV_FILE.exists():
-        for line in ENV_FILE.read_text().splitlines():
-            line = line.strip()
-            if "=" in line and not line.startswith("#"):
-                k, v = line.split("=", 1)
-                env[k.strip()] = v.strip().strip('"').strip("'")
-    return env
-
 def get_pin():
     global DASHBOARD_PIN
     if DASHBOARD_PIN is None:
-        env = load_env()
+        env = load_env(ENV_FILE)
         DASHBOARD_PIN = env.get("BSKY_DASHBOARD_PIN", "yuzu2026")
     return DASHBOARD_PIN
 
@@ -47,13 +44,96 @@ def login_required(f):
         return f(*args, **kwargs)
     return decorated
 
+# mkstemp files are 0600; new queue files get the usual 0666 & ~umask instead
+# (read once here — os.umask can only be read by setting it, which isn't thread-safe)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+# app.run() is threaded: held across load → mutate → save so writes can't interleave
+_QUEUE_LOCK = threading.Lock()
+
+# Parsed queue + {id: post} index, reused while the file's mtime is unchanged.
+# Shared between requests and mutated in place by writers, so only touch it under _QUEUE_LOCK.
+_QUEUE_CACHE = {"mtime": -1, "data": None, "index": None, "aggregates": None}
+
 def load_queue():
-    if QUEUE_FILE.exists():
-        return json.loads(QUEUE_FILE.read_text())
-    return {"posts": []}
+    """Return (data, index) where index maps post id → post dict. Caller holds _QUEUE_LOCK."""
+    try:
+        mtime = QUEUE_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = None
+    if mtime != _QUEUE_CACHE["mtime"]:
+        data = json.loads(QUEUE_FILE.read_text()) if mtime is not None else {"posts": []}
+        # Older versions persisted the aggregates; they only live in the cache now
+        for key in ("counts", "next_approved_id", "next_approved_by_type"):
+            data.pop(key, None)
+        _QUEUE_CACHE["data"] = data
+        _QUEUE_CACHE["index"] = {p["id"]: p for p in data["posts"]}
+        _QUEUE_CACHE["aggregates"] = queue_aggregates(data["posts"])
+        _QUEUE_CACHE["mtime"] = mtime
+    return _QUEUE_CACHE["data"], _QUEUE_CACHE["index"]
+
+def cached_aggregates():
+    """Aggregates for the queue last returned by load_queue(). Caller holds _QUEUE_LOCK."""
+    return _QUEUE_CACHE["aggregates"]
+
+STATUSES = ("pending", "approved", "posted", "rejected")
+
+def oldest_approved(posts, filter_type=None, skip_type=None):
+    """Oldest approved post matching the type filters, in a single pass."""
+    best = None
+    for p in posts:
+        if p["status"] != "approved":
+            continue
+        post_type = p.get("type", "post")
+        if (filter_type and post_type != filter_type) or (skip_type and post_type == skip_type):
+            continue
+        if best is None or p.get("created_at", "") < best.get("created_at", ""):
+            best = p
+    return best
+
+def queue_aggregates(posts):
+    """Per-status counts and the next approved post ids, computed once per file read."""
+    counts = dict.fromkeys(STATUSES, 0)
+    for p in posts:
+        counts[p["status"]] = counts.get(p["status"], 0) + 1
+    nxt = oldest_approved(posts)
+    by_type = {}
+    for post_type in ("post", "reply"):
+        p = oldest_approved(posts, filter_type=post_type)
+        by_type[post_type] = p["id"] if p else None
+    return {
+        "counts": counts,
+        "next_approved_id": nxt["id"] if nxt else None,
+        "next_approved_by_type": by_type,
+    }
+
+def queue_etag(*variant):
+    """Weak ETag from the queue file's mtime, plus any request params the body depends on."""
+    try:
+        mtime = QUEUE_FILE.stat().st_mtime_ns
+    except FileNotFoundError:
+        mtime = 0
+    tag = "-".join([str(mtime), *(v or "" for v in variant)])
+    return f'W/"{tag}"'
 
 def save_queue(data):
-    QUEUE_FILE.write_text(json.dumps(data, indent=2, ensure_ascii=False))
+    """Write the queue; callers hold _QUEUE_LOCK."""
+    _QUEUE_CACHE["mtime"] = -1
+    # Write compact JSON to a unique temp file, then rename over the queue atomically
+    fd, tmp = tempfile.mkstemp(dir=QUEUE_FILE.parent, prefix=".bsky-queue.", suffix=".tmp")
+    try:
+        try:
+            mode = stat.S_IMODE(QUEUE_FILE.stat().st_mode)
+        except FileNotFoundError:
+            mode = 0o666 & ~_UMASK
+        os.fchmod(fd, mode)  # keep the queue's permissions across the rename
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(json.dumps(data, ensure_ascii=False, separators=(",", ":")))
+        os.replace(tmp, QUEUE_FILE)
+    except BaseException:
+        os.unlink(tmp)
+        raise
 
 # ─── Templates ───
 
@@ -64,25 +144,7 @@ LOGIN_HTML = """
 <meta charset="utf-8">
 <meta name="viewport" content="width=device-width, initial-scale=1">
 <title>🍋 Chadd Bluesky Dashboard</title>
-<style>
-  * { box-sizing: border-box; margin: 0; padding: 0; }
-  body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', system-ui, sans-serif;
-         background: #0f1419; color: #e7e9ea; display: flex; align-items: center;
-         justify-content: center; min-height: 100vh; }
-  .login-box { background: #16202a; border: 1px solid #2f3336; border-radius: 16px;
-               padding: 40px; width: 340px; text-align: center; }
-  .login-box h1 { font-size: 24px; margin-bottom: 8px; }
-  .login-box p { color: #71767b; margin-bottom: 24px; font-size: 14px; }
-  input[type=password] { width: 100%; padding: 12px 16px; border-radius: 8px;
-                         border: 1px solid #2f3336; background: #0f1419; color: #e7e9ea;
-                         font-size: 16px; margin-bottom: 16px; outline: none; }
-  input[type=password]:focus { border-color: #1d9bf0; }
-  button { width: 100%; padding: 12px; border-radius: 24px; border: none;
-           background: #1d9bf0; color: white; font-size: 16px; font-weight: 700;
-           cursor: pointer; }
-  button:hover { background: #1a8cd8; }
-  .error { color: #f4212e; font-size: 13px; margin-bottom: 12px; }
-</style>
+<link rel="stylesheet" href="{{ url_for('static', filename='login.css') }}">
 </head>
 <body>
 <div class="login-box">
@@ -105,64 +167,7 @@ DASHBOARD_HTML = """
 <meta charset="utf-8">
 <meta name="viewport" content="width=device-width, initial-scale=1">
 <title>🍋 Chadd — Bluesky Posts</title>
-<style>
-  * { box-sizing: border-box; margin: 0; padding: 0; }
-  body { font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', system-ui, sans-serif;
-         background: #0f1419; color: #e7e9ea; padding: 16px; max-width: 640px; margin: 0 auto; }
-  header { display: flex; align-items: center; justify-content: space-between;
-           padding: 16px 0; border-bottom: 1px solid #2f3336; margin-bottom: 20px; }
-  header h1 { font-size: 20px; }
-  header a { color: #71767b; text-decoration: none; font-size: 13px; }
-  .tabs { display: flex; gap: 0; margin-bottom: 20px; border-bottom: 1px solid #2f3336; }
-  .tab { padding: 12px 20px; color: #71767b; text-decoration: none; font-size: 14px;
-         font-weight: 600; border-bottom: 2px solid transparent; }
-  .tab.active { color: #e7e9ea; border-bottom-color: #1d9bf0; }
-  .tab:hover { background: rgba(231,233,234,0.05); }
-  .post-card { background: #16202a; border: 1px solid #2f3336; border-radius: 12px;
-               padding: 16px; margin-bottom: 12px; }
-  .post-text { font-size: 15px; line-height: 1.5; white-space: pre-wrap; margin-bottom: 12px; }
-  .reply-context { background: #0f1419; border: 1px solid #2f3336; border-radius: 8px;
-                   padding: 10px 12px; margin-bottom: 10px; font-size: 13px; color: #71767b; }
-  .reply-context .reply-author { color: #1d9bf0; font-weight: 600; }
-  .reply-context .reply-label { font-size: 11px; text-transform: uppercase; letter-spacing: 0.5px;
-                                 margin-bottom: 4px; color: #536471; }
-  .badge-reply { background: #1d4e7a; color: #1d9bf0; }
-  .post-meta { font-size: 12px; color: #71767b; margin-bottom: 12px; }
-  .post-actions { display: flex; gap: 8px; }
-  .btn { padding: 8px 20px; border-radius: 20px; border: none; font-size: 14px;
-         font-weight: 700; cursor: pointer; text-decoration: none; display: inline-block; }
-  .btn-approve { background: #00ba7c; color: white; }
-  .btn-approve:hover { background: #00a06a; }
-  .btn-reject { background: transparent; color: #f4212e; border: 1px solid #67070f; }
-  .btn-reject:hover { background: rgba(244,33,46,0.1); }
-  .btn-edit { background: transparent; color: #1d9bf0; border: 1px solid #1d4e7a; }
-  .btn-edit:hover { background: rgba(29,155,240,0.1); }
-  .btn-delete { background: transparent; color: #71767b; border: 1px solid #2f3336; }
-  .btn-delete:hover { background: rgba(231,233,234,0.05); }
-  .badge { display: inline-block; padding: 2px 10px; border-radius: 12px; font-size: 12px;
-           font-weight: 600; margin-bottom: 8px; }
-  .badge-pending { background: #1d4e7a; color: #1d9bf0; }
-  .badge-approved { background: #0d3c26; color: #00ba7c; }
-  .badge-rejected { background: #67070f; color: #f4212e; }
-  .badge-posted { background: #2f3336; color: #71767b; }
-  .empty { text-align: center; color: #71767b; padding: 40px; font-size: 15px; }
-  .compose { background: #16202a; border: 1px solid #2f3336; border-radius: 12px;
-             padding: 16px; margin-bottom: 20px; }
-  textarea { width: 100%; padding: 12px; border-radius: 8px; border: 1px solid #2f3336;
-             background: #0f1419; color: #e7e9ea; font-size: 15px; font-family: inherit;
-             resize: vertical; min-height: 80px; outline: none; }
-  textarea:focus { border-color: #1d9bf0; }
-  .compose-actions { display: flex; justify-content: space-between; align-items: center; margin-top: 12px; }
-  .char-count { font-size: 13px; color: #71767b; }
-  .char-count.warn { color: #ffad1f; }
-  .char-count.over { color: #f4212e; }
-  .edit-form textarea { margin-bottom: 8px; }
-  .edit-form { display: none; }
-  .edit-form.active { display: block; }
-  .post-text-display { cursor: default; }
-  .status-msg { padding: 12px 16px; border-radius: 8px; margin-bottom: 16px; font-size: 14px; }
-  .status-success { background: #0d3c26; color: #00ba7c; border: 1px solid #00ba7c33; }
-</style>
+<link rel="stylesheet" href="{{ url_for('static', filename='dashboard.css') }}">
 </head>
 <body>
 <header>
@@ -280,6 +285,10 @@ function toggleEdit(id) {
 </html>
 """
 
+# Compile once at import instead of re-parsing on every request
+_LOGIN_TMPL = app.jinja_env.from_string(LOGIN_HTML)
+_DASH_TMPL = app.jinja_env.from_string(DASHBOARD_HTML)
+
 # ─── Routes ───
 
 @app.route("/login", methods=["GET", "POST"])
@@ -290,7 +299,7 @@ def login():
             session["authenticated"] = True
             return redirect(url_for("dashboard"))
         error = "Falscher PIN"
-    return render_template_string(LOGIN_HTML, error=error)
+    return _LOGIN_TMPL.render(error=error)
 
 @app.route("/logout")
 def logout():
@@ -300,21 +309,20 @@ def logout():
 @app.route("/")
 @login_required
 def dashboard():
-    data = load_queue()
     tab = request.args.get("tab", "pending")
     status_msg = request.args.get("msg")
     
-    counts = {}
-    for s in ["pending", "approved", "posted", "rejected"]:
-        counts[s] = sum(1 for p in data["posts"] if p["status"] == s)
-    
-    filtered = [p for p in data["posts"] if p["status"] == tab]
-    # Sort: newest first
-    filtered.sort(key=lambda p: p.get("created_at", ""), reverse=True)
-    
-    return render_template_string(DASHBOARD_HTML,
-        posts=data["posts"], filtered_posts=filtered, tab=tab,
-        counts=counts, status_msg=status_msg)
+    with _QUEUE_LOCK:
+        data, _ = load_queue()
+        counts = cached_aggregates()["counts"]
+        
+        # Sort: newest first
+        filtered = sorted((p for p in data["posts"] if p["status"] == tab),
+                          key=lambda p: p.get("created_at", ""), reverse=True)
+        
+        return _DASH_TMPL.render(
+            posts=data["posts"], filtered_posts=filtered, tab=tab,
+            counts=counts, status_msg=status_msg)
 
 @app.route("/add", methods=["POST"])
 @login_required
@@ -323,7 +331,6 @@ def add_post():
     if not text:
         return redirect(url_for("dashboard"))
     
-    data = load_queue()
     post = {
         "id": uuid.uuid4().hex[:8],
         "text": text,
@@ -333,31 +340,33 @@ def add_post():
         "posted_at": None,
         "post_uri": None,
     }
-    data["posts"].append(post)
-    save_queue(data)
+    with _QUEUE_LOCK:
+        data, _ = load_queue()
+        data["posts"].append(post)
+        save_queue(data)
     return redirect(url_for("dashboard", msg="Post hinzugefügt", tab="pending"))
 
 @app.route("/approve/<post_id>", methods=["POST"])
 @login_required
 def approve_post(post_id):
-    data = load_queue()
-    for p in data["posts"]:
-        if p["id"] == post_id:
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        p = index.get(post_id)
+        if p:
             p["status"] = "approved"
             p["approved_at"] = datetime.now().isoformat(timespec="seconds")
-            break
-    save_queue(data)
+        save_queue(data)
     return redirect(url_for("dashboard", msg="Post freigegeben ✓", tab="approved"))
 
 @app.route("/reject/<post_id>", methods=["POST"])
 @login_required
 def reject_post(post_id):
-    data = load_queue()
-    for p in data["posts"]:
-        if p["id"] == post_id:
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        p = index.get(post_id)
+        if p:
             p["status"] = "rejected"
-            break
-    save_queue(data)
+        save_queue(data)
     return redirect(url_for("dashboard", msg="Post abgelehnt", tab="rejected"))
 
 @app.route("/edit/<post_id>", methods=["POST"])
@@ -366,24 +375,25 @@ def edit_post(post_id):
     text = request.form.get("text", "").strip()
     if not text:
         return redirect(url_for("dashboard"))
-    data = load_queue()
-    for p in data["posts"]:
-        if p["id"] == post_id:
-            p["text"] = text
-            break
-    save_queue(data)
     tab = "pending"
-    for p in data["posts"]:
-        if p["id"] == post_id:
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        p = index.get(post_id)
+        if p:
+            p["text"] = text
             tab = p["status"]
+        save_queue(data)
     return redirect(url_for("dashboard", msg="Post bearbeitet", tab=tab))
 
 @app.route("/delete/<post_id>", methods=["POST"])
 @login_required
 def delete_post(post_id):
-    data = load_queue()
-    data["posts"] = [p for p in data["posts"] if p["id"] != post_id]
-    save_queue(data)
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        p = index.pop(post_id, None)
+        if p:
+            data["posts"].remove(p)
+        save_queue(data)
     return redirect(url_for("dashboard", msg="Post gelöscht"))
 
 # ─── API (for Chadd's scripts) ───
@@ -403,21 +413,23 @@ def api_next_approved():
     filter_type = request.args.get("type")
     skip_type = request.args.get("skip_type")
     
-    data = load_queue()
-    approved = [p for p in data["posts"] if p["status"] == "approved"]
-    
-    # Apply type filters
-    if filter_type:
-        approved = [p for p in approved if p.get("type", "post") == filter_type]
-    if skip_type:
-        approved = [p for p in approved if p.get("type", "post") != skip_type]
-    
-    approved.sort(key=lambda p: p.get("created_at", ""))
+    etag = queue_etag(filter_type, skip_type)
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304
     
-    if approved:
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        if skip_type:
+            best = oldest_approved(data["posts"], filter_type, skip_type)
+        elif filter_type:
+            best = index.get(cached_aggregates()["next_approved_by_type"].get(filter_type))
+        else:
+            best = index.get(cached_aggregates()["next_approved_id"])
+        
         # Return full post object including type and reply_to
-        return jsonify(approved[0])
-    return jsonify(None)
+        resp = jsonify(best)
+    resp.headers["ETag"] = etag
+    return resp
 
 @app.route("/api/mark-posted/<post_id>", methods=["POST"])
 def api_mark_posted(post_id):
@@ -428,15 +440,15 @@ def api_mark_posted(post_id):
     
     post_uri = request.json.get("post_uri") if request.is_json else request.args.get("post_uri")
     
-    data = load_queue()
-    for p in data["posts"]:
-        if p["id"] == post_id:
+    with _QUEUE_LOCK:
+        data, index = load_queue()
+        p = index.get(post_id)
+        if p:
             p["status"] = "posted"
             p["posted_at"] = datetime.now().isoformat(timespec="seconds")
             if post_uri:
                 p["post_uri"] = post_uri
-            break
-    save_queue(data)
+        save_queue(data)
     return jsonify({"ok": True})
 
 @app.route("/api/add", methods=["POST"])
@@ -469,10 +481,15 @@ def api_add_post():
             "author_handle": body["reply_to"].get("author_handle", ""),
             "text_preview": body["reply_to"].get("text_preview", "")[:200],
         }
+        # Optional thread root, lets the autoposter skip the root lookup
+        if body["reply_to"].get("root_uri") and body["reply_to"].get("root_cid"):
+            post["reply_to"]["root_uri"] = body["reply_to"]["root_uri"]
+            post["reply_to"]["root_cid"] = body["reply_to"]["root_cid"]
     
-    data = load_queue()
-    data["posts"].append(post)
-    save_queue(data)
+    with _QUEUE_LOCK:
+        data, _ = load_queue()
+        data["posts"].append(post)
+        save_queue(data)
     return jsonify({"ok": True, "id": post["id"]})
 
 @app.route("/api/queue")
@@ -481,7 +498,14 @@ def api_queue():
     token = request.headers.get("X-Token") or request.args.get("token")
     if token != get_pin():
         return jsonify({"error": "unauthorized"}), 401
-    return jsonify(load_queue())
+    etag = queue_etag()
+    if request.headers.get("If-None-Match") == etag:
+        return "", 304
+    with _QUEUE_LOCK:
+        data, _ = load_queue()
+        resp = jsonify(data)
+    resp.headers["ETag"] = etag
+    return resp
 
 if __name__ == "__main__":
     import argparse
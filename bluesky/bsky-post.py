@@ -1,27 +1,22 @@
 #!/usr/bin/env python3
 """Bluesky posting script."""
 
-import json
 import os
 import sys
-from atproto import Client
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+from chadd_bsky import get_client
 
 # Load credentials
-env = {}
-with open(os.path.expanduser("~/.chadd-mail.env")) as f:
-    for line in f:
-        line = line.strip()
-        if line and not line.startswith("#") and "=" in line:
-            k, v = line.split("=", 1)
-            env[k.strip()] = v.strip()
+env = load_env()
 
 HANDLE = env.get("BSKY_HANDLE", "chadd-yuzu.bsky.social")
 PASSWORD = env.get("BSKY_PASS")
 
 def post(text):
     """Post to Bluesky."""
-    client = Client()
-    client.login(HANDLE, PASSWORD)
+    client = get_client(HANDLE, PASSWORD)
     resp = client.send_post(text)
     print(f"✅ Posted!")
     print(f"   URI: {resp.uri}")
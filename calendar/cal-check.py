@@ -1,24 +1,37 @@
 #!/usr/bin/env python3
 """Check OwnCloud CalDAV calendar for events."""
+import gzip
+import io
 import os
 import sys
-import json
 import re
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from urllib.request import Request, urlopen
 from urllib.parse import quote
 
-def load_env():
-    env = {}
-    with open(os.path.expanduser("~/.chadd-mail.env")) as f:
-        for line in f:
-            if "=" in line:
-                k, v = line.strip().split("=", 1)
-                env[k] = v
-    return env
+try:
+    from lxml import etree as ET  # libxml2-backed, much faster on large multistatus bodies
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Multistatus XML compresses ~10x; only advertise br when we can decode it
+ACCEPT_ENCODING = "gzip, br" if brotli else "gzip"
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+from chadd_json import dumps
+
+@contextmanager
 def caldav_request(url, user, pw, method="PROPFIND", body="", headers=None):
-    hdrs = {"Content-Type": "application/xml", "Depth": "1"}
+    """Send a CalDAV request; yields the (decompressed) response body as a stream."""
+    hdrs = {"Content-Type": "application/xml", "Depth": "1", "Accept-Encoding": ACCEPT_ENCODING}
     if headers:
         hdrs.update(headers)
     import base64
@@ -26,24 +39,37 @@ def caldav_request(url, user, pw, method="PROPFIND", body="", headers=None):
     hdrs["Authorization"] = f"Basic {auth}"
     req = Request(url, data=body.encode() if body else None, headers=hdrs, method=method)
     with urlopen(req) as resp:
-        return resp.read().decode()
+        encoding = resp.headers.get("Content-Encoding", "").lower()
+        if encoding == "gzip":
+            yield gzip.GzipFile(fileobj=resp)
+        elif encoding == "br" and brotli:
+            yield io.BytesIO(brotli.decompress(resp.read()))
+        else:
+            yield resp
+
+# VEVENT bodies, and "NAME;PARAMS:VALUE" content lines (quoted params may contain ":")
+VEVENT_RE = re.compile(r"^BEGIN:VEVENT\r?\n(.*?)^END:VEVENT", re.M | re.S)
+CONTENT_LINE_RE = re.compile(r'([A-Za-z0-9-]+)(?:;(?:[^":]|"[^"]*")*)?:(.*)')
+# Folded continuation lines (RFC 5545 3.1); XML parsing may have turned CRLF into LF
+UNFOLD_RE = re.compile(r"\r?\n[ \t]")
 
 def parse_ical_events(data):
-    """Simple iCal parser — extracts VEVENT blocks."""
+    """Simple iCal parser — extracts VEVENT properties (nested VALARMs are skipped)."""
     events = []
-    in_event = False
-    event = {}
-    for line in data.replace("\r\n ", "").replace("\r\n\t", "").split("\r\n"):
-        if line.strip() == "BEGIN:VEVENT":
-            in_event = True
-            event = {}
-        elif line.strip() == "END:VEVENT":
-            in_event = False
-            events.append(event)
-        elif in_event and ":" in line:
-            key, _, val = line.partition(":")
-            key = key.split(";")[0]
-            event[key] = val
+    data = UNFOLD_RE.sub("", data)
+    for block in VEVENT_RE.findall(data):
+        event = {}
+        depth = 0
+        for line in block.splitlines():
+            if line.startswith("BEGIN:"):
+                depth += 1
+            elif line.startswith("END:"):
+                depth -= 1
+            elif not depth:
+                m = CONTENT_LINE_RE.match(line)
+                if m:
+                    event[m.group(1)] = m.group(2)
+        events.append(event)
     return events
 
 def parse_dt(s):
@@ -56,6 +82,36 @@ def parse_dt(s):
             continue
     return None
 
+def fetch_events(cal_name, cal_url, user, pw, body):
+    """REPORT one calendar and return its events; errors are logged, not raised."""
+    result = []
+    try:
+        with caldav_request(cal_url, user, pw, method="REPORT", body=body, headers={"Depth": "1"}) as resp:
+            # Stream the multistatus: handle each <d:response> as it completes, then drop it
+            for _, elem in ET.iterparse(resp, events=("end",)):
+                if elem.tag != "{DAV:}response":
+                    continue
+                cal_data = elem.find(".//{urn:ietf:params:xml:ns:caldav}calendar-data")
+                if cal_data is not None and cal_data.text:
+                    events = parse_ical_events(cal_data.text)
+                    for ev in events:
+                        dt_start = parse_dt(ev.get("DTSTART", ""))
+                        dt_end = parse_dt(ev.get("DTEND", ""))
+                        result.append({
+                            "calendar": cal_name,
+                            "summary": ev.get("SUMMARY", "(kein Titel)"),
+                            "start": dt_start.isoformat() if dt_start else ev.get("DTSTART", "?"),
+                            "end": dt_end.isoformat() if dt_end else ev.get("DTEND", "?"),
+                            "location": ev.get("LOCATION", ""),
+                            "description": ev.get("DESCRIPTION", "")[:500],
+                            "status": ev.get("STATUS", ""),
+                        })
+                elem.clear()
+    except Exception as e:
+        print(f"[{cal_name}] Error: {e}", file=sys.stderr)
+        return []
+    return result
+
 def main():
     env = load_env()
     url = env["OWNCLOUD_URL"]
@@ -94,41 +150,19 @@ def main():
   </c:filter>
 </c:calendar-query>"""
     
-    import xml.etree.ElementTree as ET
-    ns = {"d": "DAV:", "c": "urn:ietf:params:xml:ns:caldav"}
-    
+    # REPORT all calendars concurrently — the work is network-bound
     all_events = []
-    for cal_name, cal_url in calendars:
-        try:
-            resp = caldav_request(cal_url, user, pw, method="REPORT", body=body, headers={"Depth": "1"})
-        except Exception as e:
-            print(f"[{cal_name}] Error: {e}", file=sys.stderr)
-            continue
-        
-        root = ET.fromstring(resp)
-        for response in root.findall("d:response", ns):
-            cal_data = response.find(".//c:calendar-data", ns)
-            if cal_data is not None and cal_data.text:
-                events = parse_ical_events(cal_data.text)
-                for ev in events:
-                    dt_start = parse_dt(ev.get("DTSTART", ""))
-                    dt_end = parse_dt(ev.get("DTEND", ""))
-                    all_events.append({
-                        "calendar": cal_name,
-                        "summary": ev.get("SUMMARY", "(kein Titel)"),
-                        "start": dt_start.isoformat() if dt_start else ev.get("DTSTART", "?"),
-                        "end": dt_end.isoformat() if dt_end else ev.get("DTEND", "?"),
-                        "location": ev.get("LOCATION", ""),
-                        "description": ev.get("DESCRIPTION", "")[:500],
-                        "status": ev.get("STATUS", ""),
-                    })
+    if calendars:
+        with ThreadPoolExecutor(max_workers=min(8, len(calendars))) as ex:
+            for events in ex.map(lambda c: fetch_events(*c, user, pw, body), calendars):
+                all_events.extend(events)
     
     all_events.sort(key=lambda e: e["start"])
     
     if not all_events:
         print(f"Keine Termine in den nächsten {days} Tagen.")
     else:
-        print(json.dumps(all_events, ensure_ascii=False, indent=2))
+        print(dumps(all_events))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,52 @@
+"""Shared Bluesky login for chadd-tools — one cached session for every script."""
+import json
+import os
+import tempfile
+
+SESSION_CACHE = os.path.expanduser("~/.cache/chadd-bsky-session.json")
+
+
+def save_session(client, handle):
+    """Write the client's exported session to SESSION_CACHE (mode 0600, atomic)."""
+    cache_dir = os.path.dirname(SESSION_CACHE)
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")  # created 0600
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"handle": handle, "session": client.export_session_string()}, f)
+        os.replace(tmp, SESSION_CACHE)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def get_client(handle, password):
+    """Logged-in atproto client, resuming the cached session when it is still valid.
+
+    Falls back to a password login (and rewrites the cache) when there is no
+    cached session, it belongs to another handle, or it is rejected.
+    """
+    from atproto import Client
+
+    def new_client():
+        client = Client()
+        # Registered before login() so a token refresh during login is cached too
+        client.on_session_change(lambda *_: save_session(client, handle))
+        return client
+
+    client = new_client()
+    try:
+        with open(SESSION_CACHE, encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("handle") != handle:
+            raise ValueError("cached session is for another handle")
+        client.login(session_string=cached["session"])
+        return client
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Cached Bluesky session unusable ({e}), logging in again")
+        client = new_client()
+    client.login(handle, password)
+    save_session(client, handle)
+    return client
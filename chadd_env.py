@@ -0,0 +1,21 @@
+"""Shared loader for ~/.chadd-mail.env — used by all chadd-tools scripts."""
+import os
+import re
+
+ENV_FILE = "~/.chadd-mail.env"
+
+# KEY=value lines; comments and anything else never match
+_ENV_RE = re.compile(r"^[ \t]*([A-Za-z_][A-Za-z0-9_]*)[ \t]*=(.*)$", re.M)
+
+
+def load_env(path=ENV_FILE):
+    """Parse KEY=value lines into a dict. Missing file → empty dict.
+
+    Values are stripped of surrounding whitespace and quotes.
+    """
+    try:
+        with open(os.path.expanduser(str(path)), encoding="utf-8") as f:
+            data = f.read()
+    except FileNotFoundError:
+        return {}
+    return {k: v.strip().strip('"').strip("'") for k, v in _ENV_RE.findall(data)}
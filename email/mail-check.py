@@ -1,77 +1,293 @@
 #!/usr/bin/env python3
-"""Check IMAP inbox for unread messages."""
+"""Check IMAP inbox for unread messages.
+
+Run with --daemon to keep the IMAP login open and serve checks over a Unix
+socket; plain invocations use a running daemon and fall back to logging in.
+"""
+import binascii
 import imaplib
 import email
-import email.header
+import email.policy
 import os
+import signal
+import socket
+import stat
 import sys
 import json
+import re
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+from chadd_json import dumps
+
+BODY_CHARS = 2000  # body chars kept per message in the output
+BODY_BYTES = 4096  # body bytes fetched per message
+# Per-user directory, not /tmp: anyone could squat a fixed path there
+SOCKET_DIR = os.path.join(os.environ.get("XDG_RUNTIME_DIR") or os.path.expanduser("~/.cache"), "chadd")
+SOCKET_PATH = os.path.join(SOCKET_DIR, "mail.sock")
+NOOP_INTERVAL = 25 * 60  # servers drop idle sessions after ~30 min
+# A text/plain leaf in a BODYSTRUCTURE response
+PLAIN_PART_RE = re.compile(rb'\("text" "plain"', re.I)
+
+def parse(raw):
+    # policy.default decodes RFC 2047 headers and gives us get_body()/get_content()
+    return email.message_from_bytes(raw, policy=email.policy.default)
+
+def header(msg, name):
+    value = msg[name]
+    return str(value) if value is not None else ""
 
-def decode_header(raw):
-    parts = email.header.decode_header(raw or "")
-    result = []
-    for part, enc in parts:
-        if isinstance(part, bytes):
-            result.append(part.decode(enc or "utf-8", errors="replace"))
-        else:
-            result.append(part)
-    return " ".join(result)
+def payload_bytes(part):
+    """Decoded payload of a text part, at most 4*BODY_CHARS bytes of it.
+
+    A base64 body cut by the partial fetch can end mid-quantum, which makes
+    get_payload(decode=True) give up and return the raw base64; decode only
+    whole 4-char groups instead.
+    """
+    if str(part.get("Content-Transfer-Encoding", "")).strip().lower() == "base64":
+        data = "".join(part.get_payload().split())
+        data = data[:(4 * BODY_CHARS // 3 + 1) * 4]
+        try:
+            return binascii.a2b_base64(data[:len(data) - len(data) % 4])
+        except binascii.Error:
+            pass  # stray non-alphabet characters; let the email package cope
+    return (part.get_payload(decode=True) or b"")[:4 * BODY_CHARS]
 
 def get_body(msg):
-    if msg.is_multipart():
-        for part in msg.walk():
-            ct = part.get_content_type()
-            if ct == "text/plain":
-                payload = part.get_payload(decode=True)
-                charset = part.get_content_charset() or "utf-8"
-                return payload.decode(charset, errors="replace")
-    else:
-        payload = msg.get_payload(decode=True)
-        charset = msg.get_content_charset() or "utf-8"
-        return payload.decode(charset, errors="replace") if payload else ""
-    return ""
+    part = msg.get_body(preferencelist=("plain",)) if msg.is_multipart() else msg
+    if part is None or part.get_content_maintype() != "text":
+        return ""
+    # Only decode what can end up in the BODY_CHARS output (≤ 4 bytes per char)
+    payload = payload_bytes(part)
+    try:
+        text = payload.decode(part.get_content_charset() or "utf-8", errors="replace")
+    except LookupError:
+        # Unknown charset name
+        text = payload.decode("utf-8", errors="replace")
+    return text[:BODY_CHARS]
 
-def main():
-    env_file = os.path.expanduser("~/.chadd-mail.env")
-    env = {}
-    with open(env_file) as f:
-        for line in f:
-            if "=" in line:
-                k, v = line.strip().split("=", 1)
-                env[k] = v
+def fetch_messages(imap, ids):
+    """Fetch headers plus the first BODY_BYTES of each body in one FETCH.
 
-    unseen_only = "--all" not in sys.argv
-    limit = int(sys.argv[sys.argv.index("--limit") + 1]) if "--limit" in sys.argv else 10
+    Returns [(id, header, text)]; header + text parses as a (possibly truncated) message.
+    """
+    _, msg_data = imap.fetch(b",".join(ids).decode(), f"(BODY.PEEK[HEADER] BODY.PEEK[TEXT]<0.{BODY_BYTES}>)")
+    messages = []
+    for item in msg_data:
+        # Literals arrive as (prefix, bytes) tuples; a prefix starting with the
+        # message number opens a new message, b')' closes it
+        if not isinstance(item, tuple):
+            continue
+        prefix, payload = item
+        if prefix[:1].isdigit():
+            messages.append([prefix.split()[0], {}])
+        section = b"HEADER" if b"BODY[HEADER]" in prefix else b"TEXT"
+        messages[-1][1][section] = payload
+    return [(mid, parts.get(b"HEADER", b""), parts.get(b"TEXT", b"")) for mid, parts in messages]
 
+def split_fetch(msg_data):
+    """Group a FETCH response by message: {id: bytes of everything sent for it}."""
+    messages = {}
+    mid = None
+    for item in msg_data:
+        # Literals arrive as (prefix, bytes) tuples; plain lines as bytes
+        chunk = b"".join(item) if isinstance(item, tuple) else item
+        if chunk[:1].isdigit():
+            mid = chunk.split()[0]
+            messages[mid] = b""
+        if mid is not None:
+            messages[mid] += chunk
+    return messages
+
+def fetch_full(imap, ids):
+    """Whole messages {id: raw} for those of ids that have a text/plain part.
+
+    BODYSTRUCTURE is cheap; it keeps HTML-only mail with big attachments
+    from being downloaded for nothing. Two FETCHes however many ids.
+    """
+    _, data = imap.fetch(b",".join(ids).decode(), "(BODYSTRUCTURE)")
+    wanted = [mid for mid, st in split_fetch(data).items() if PLAIN_PART_RE.search(st)]
+    if not wanted:
+        return {}
+    _, data = imap.fetch(b",".join(wanted).decode(), "(BODY.PEEK[])")
+    full = {}
+    for item in data:
+        if isinstance(item, tuple) and item[0][:1].isdigit():
+            full[item[0].split()[0]] = item[1]
+    return full
+
+def drop_cut_part(msg, text):
+    """Strip a trailing MIME part whose headers the partial fetch cut off.
+
+    The parser would read the header fragment as the body of a default
+    text/plain part. Returns text unchanged when nothing was cut.
+    """
+    if len(text) < BODY_BYTES:
+        return text  # the whole body fit in the partial fetch
+    start = text.rfind(b"\n--") + 1
+    tail = text[start:]
+    if b"\n\r\n" in tail or b"\n\n" in tail:
+        return text  # last part's headers are complete
+    # The cut may even land inside the boundary line itself
+    line = tail.split(b"\n", 1)[0].rstrip(b"\r")
+    for b in (p.get_boundary() for p in msg.walk() if p.is_multipart()):
+        delim = b"--" + b.encode() if b else None
+        if delim and (line.startswith(delim) or delim.startswith(line)):
+            return text[:start]
+    return text
+
+def connect(env):
     imap = imaplib.IMAP4_SSL(env["MAIL_IMAP"], 993)
     imap.login(env["MAIL_USER"], env["MAIL_PASS"])
     imap.select("INBOX")
+    return imap
 
+def check(imap, unseen_only=True, limit=10):
+    """Return the newest `limit` (unseen) messages as dicts."""
     criteria = "UNSEEN" if unseen_only else "ALL"
     _, data = imap.search(None, criteria)
     ids = data[0].split()
-
     if not ids:
-        print("No messages." if unseen_only else "Inbox empty.")
-        imap.logout()
-        return
+        return []
+
+    messages = []
+    cut_short = []
+    for mid, head, text in fetch_messages(imap, ids[-limit:]):
+        msg = parse(head + text)
+        if msg.is_multipart() and len(text) >= BODY_BYTES:
+            trimmed = drop_cut_part(msg, text)
+            if len(trimmed) < len(text):
+                msg = parse(head + trimmed)
+            if not get_body(msg):
+                # text/plain may be cut off or come after a big part
+                cut_short.append(mid)
+        messages.append((mid, msg))
+    if cut_short:
+        full = fetch_full(imap, cut_short)
+        messages = [(mid, parse(full[mid]) if mid in full else msg) for mid, msg in messages]
 
     results = []
-    for mid in ids[-limit:]:
-        _, msg_data = imap.fetch(mid, "(BODY.PEEK[])")
-        raw = msg_data[0][1]
-        msg = email.message_from_bytes(raw)
+    for mid, msg in messages:
         results.append({
             "id": mid.decode(),
-            "from": decode_header(msg["From"]),
-            "to": decode_header(msg["To"]),
-            "subject": decode_header(msg["Subject"]),
-            "date": msg["Date"],
-            "body": get_body(msg)[:2000]
+            "from": header(msg, "From"),
+            "to": header(msg, "To"),
+            "subject": header(msg, "Subject"),
+            "date": str(msg["Date"]) if msg["Date"] is not None else None,
+            "body": get_body(msg)
         })
+    return results
+
+def private_socket_dir():
+    """Create SOCKET_DIR (0700) if needed and refuse to use it unless it is ours alone."""
+    os.makedirs(SOCKET_DIR, mode=0o700, exist_ok=True)
+    st = os.lstat(SOCKET_DIR)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise RuntimeError(f"{SOCKET_DIR} must be a directory owned by you with mode 0700")
+
+def serve(env):
+    """Keep one IMAP login open and answer check requests on SOCKET_PATH.
+
+    Protocol: one JSON line in ({"op": "check", "limit": 10, "all": false}),
+    one JSON line out ({"ok": true, "results": [...]} or {"ok": false, "error": ...}).
+    """
+    imap = None
+    private_socket_dir()
+    if os.path.exists(SOCKET_PATH):
+        os.unlink(SOCKET_PATH)
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(SOCKET_PATH)
+    os.chmod(SOCKET_PATH, 0o600)
+    server.listen()
+    # Wake up periodically to NOOP so the server doesn't drop the idle session
+    server.settimeout(NOOP_INTERVAL)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))  # run the cleanup below
+    print(f"Mail daemon listening on {SOCKET_PATH}", flush=True)
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                if imap is not None:
+                    try:
+                        imap.noop()
+                    except (imaplib.IMAP4.abort, OSError):
+                        imap = None  # reconnect lazily on the next request
+                continue
+
+            with conn:
+                conn.settimeout(10)
+                try:
+                    req = json.loads(conn.makefile("rb").readline() or b"{}")
+                    if req.get("op") != "check":
+                        raise ValueError(f"unknown op {req.get('op')!r}")
+                    for attempt in range(2):
+                        try:
+                            if imap is None:
+                                imap = connect(env)
+                            else:
+                                imap.noop()  # pick up mailbox changes since the last request
+                            results = check(imap, not req.get("all"), int(req.get("limit", 10)))
+                            break
+                        except (imaplib.IMAP4.abort, OSError):
+                            imap = None
+                            if attempt:
+                                raise
+                    reply = {"ok": True, "results": results}
+                except Exception as e:
+                    reply = {"ok": False, "error": str(e)}
+                try:
+                    conn.sendall(json.dumps(reply, ensure_ascii=False).encode() + b"\n")
+                except OSError:
+                    pass
+    finally:
+        server.close()
+        os.unlink(SOCKET_PATH)
+        if imap is not None:
+            imap.logout()
+
+def query_daemon(unseen_only, limit):
+    """Ask a running daemon for results; None if no daemon is listening."""
+    private_socket_dir()
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    client.settimeout(60)
+    try:
+        client.connect(SOCKET_PATH)
+    except (FileNotFoundError, ConnectionRefusedError):
+        client.close()
+        return None
+    with client:
+        req = {"op": "check", "limit": limit, "all": not unseen_only}
+        client.sendall(json.dumps(req).encode() + b"\n")
+        reply = json.loads(client.makefile("rb").readline())
+    if not reply["ok"]:
+        raise RuntimeError(f"mail daemon: {reply['error']}")
+    return reply["results"]
+
+def main():
+    env = load_env()
+
+    if "--daemon" in sys.argv:
+        serve(env)
+        return
+
+    unseen_only = "--all" not in sys.argv
+    limit = int(sys.argv[sys.argv.index("--limit") + 1]) if "--limit" in sys.argv else 10
+
+    results = query_daemon(unseen_only, limit)
+    if results is None:
+        imap = connect(env)
+        try:
+            results = check(imap, unseen_only, limit)
+        finally:
+            imap.logout()
+
+    if not results:
+        print("No messages." if unseen_only else "Inbox empty.")
+        return
 
-    print(json.dumps(results, ensure_ascii=False, indent=2))
-    imap.logout()
+    print(dumps(results))
 
 if __name__ == "__main__":
     main()
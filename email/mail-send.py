@@ -8,6 +8,46 @@ import argparse
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
+
+# Created once; loading the CA bundle is the costly part of a TLS context
+SSL_CTX = ssl.create_default_context()
+
+def build_message(env, to, subject, body, html=False, cc=None, reply_to=None):
+    """Return (message, recipients) for one email."""
+    msg = MIMEMultipart("alternative") if html else MIMEText(body, "plain", "utf-8")
+    if html:
+        msg.attach(MIMEText(body, "html", "utf-8"))
+
+    msg["From"] = f"Chadd <{env['MAIL_USER']}>"
+    msg["To"] = to
+    msg["Subject"] = subject
+    if cc:
+        msg["Cc"] = cc
+    if reply_to:
+        msg["In-Reply-To"] = reply_to
+        msg["References"] = reply_to
+
+    recipients = [to]
+    if cc:
+        recipients.append(cc)
+    return msg, recipients
+
+def send_many(messages, env=None):
+    """Send several emails over one SMTP connection (one TLS handshake + login).
+
+    Each message is a dict with the build_message() keywords: to, subject, body,
+    and optionally html, cc, reply_to.
+    """
+    env = env or load_env()
+    with smtplib.SMTP_SSL(env["MAIL_SMTP"], 465, context=SSL_CTX) as s:
+        s.login(env["MAIL_USER"], env["MAIL_PASS"])
+        for m in messages:
+            msg, recipients = build_message(env, **m)
+            s.sendmail(env["MAIL_USER"], recipients, msg.as_string())
+            print(f"Sent to {m['to']}: {m['subject']}")
+
 def main():
     parser = argparse.ArgumentParser(description="Send email")
     parser.add_argument("--to", required=True, help="Recipient email")
@@ -18,37 +58,14 @@ def main():
     parser.add_argument("--reply-to", help="In-Reply-To message ID")
     args = parser.parse_args()
 
-    env_file = os.path.expanduser("~/.chadd-mail.env")
-    env = {}
-    with open(env_file) as f:
-        for line in f:
-            if "=" in line:
-                k, v = line.strip().split("=", 1)
-                env[k] = v
-
-    msg = MIMEMultipart("alternative") if args.html else MIMEText(args.body, "plain", "utf-8")
-    if args.html:
-        msg.attach(MIMEText(args.body, "html", "utf-8"))
-
-    msg["From"] = f"Chadd <{env['MAIL_USER']}>"
-    msg["To"] = args.to
-    msg["Subject"] = args.subject
-    if args.cc:
-        msg["Cc"] = args.cc
-    if args.reply_to:
-        msg["In-Reply-To"] = args.reply_to
-        msg["References"] = args.reply_to
-
-    recipients = [args.to]
-    if args.cc:
-        recipients.append(args.cc)
-
-    ctx = ssl.create_default_context()
-    with smtplib.SMTP_SSL(env["MAIL_SMTP"], 465, context=ctx) as s:
-        s.login(env["MAIL_USER"], env["MAIL_PASS"])
-        s.sendmail(env["MAIL_USER"], recipients, msg.as_string())
-    
-    print(f"Sent to {args.to}: {args.subject}")
+    send_many([{
+        "to": args.to,
+        "subject": args.subject,
+        "body": args.body,
+        "html": args.html,
+        "cc": args.cc,
+        "reply_to": args.reply_to,
+    }])
 
 if __name__ == "__main__":
     main()
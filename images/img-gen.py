@@ -1,41 +1,65 @@
 #!/usr/bin/env python3
-"""Generate images via Freepik Mystic API."""
+"""Generate images via Freepik Mystic API.
+
+Needs httpx with HTTP/2 support: pip install 'httpx[http2]'
+"""
+import asyncio
 import json
 import os
 import sys
-import time
-import urllib.request
-import urllib.error
 import argparse
+import httpx
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
 
-API_KEY = os.environ.get("FREEPIK_API_KEY", "")
-if not API_KEY:
-    env_file = os.path.expanduser("~/.chadd-mail.env")
-    if os.path.exists(env_file):
-        with open(env_file) as f:
-            for line in f:
-                if line.startswith("FREEPIK_API_KEY="):
-                    API_KEY = line.strip().split("=", 1)[1]
+API_KEY = os.environ.get("FREEPIK_API_KEY", "") or load_env().get("FREEPIK_API_KEY", "")
 
 BASE_URL = "https://api.freepik.com"
 
 
-def api_request(method, path, data=None):
-    url = f"{BASE_URL}{path}"
-    headers = {
-        "x-freepik-api-key": API_KEY,
-        "Content-Type": "application/json"
-    }
-    body = json.dumps(data).encode() if data else None
-    req = urllib.request.Request(url, data=body, headers=headers, method=method)
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return json.loads(resp.read())
+def make_client():
+    """Async HTTP/2 client; one connection carries every request and poll of a run."""
+    return httpx.AsyncClient(
+        http2=True,
+        base_url=BASE_URL,
+        headers={
+            "x-freepik-api-key": API_KEY,
+            "Content-Type": "application/json"
+        },
+        timeout=30,
+    )
+
+
+async def api_request(client, method, path, data=None):
+    resp = await client.request(method, path, json=data if data else None)
+    resp.raise_for_status()
+    return resp.json()
+
 
+async def download(client, url, output):
+    """Stream url to output in 64 KiB chunks over the shared client."""
+    request = client.build_request("GET", url)
+    del request.headers["x-freepik-api-key"]  # the image lives on a CDN; don't leak the key
+    # Follow CDN redirects like urlretrieve did (only here: the key is already stripped)
+    resp = await client.send(request, stream=True, follow_redirects=True)
+    try:
+        resp.raise_for_status()
+        with open(output, "wb") as f:
+            async for chunk in resp.aiter_bytes(65536):
+                f.write(chunk)
+    finally:
+        await resp.aclose()
 
-def generate(prompt, resolution="2k", aspect_ratio="square_1_1", realism=True, output=None):
+
+async def generate(prompt, resolution="2k", aspect_ratio="square_1_1", realism=True, output=None, client=None):
+    if client is None:
+        async with make_client() as client:
+            return await generate(prompt, resolution, aspect_ratio, realism, output, client)
+    
     print(f"Generating: {prompt[:80]}...", file=sys.stderr)
     
-    result = api_request("POST", "/v1/ai/mystic", {
+    result = await api_request(client, "POST", "/v1/ai/mystic", {
         "prompt": prompt,
         "resolution": resolution,
         "aspect_ratio": aspect_ratio,
@@ -53,8 +77,8 @@ def generate(prompt, resolution="2k", aspect_ratio="square_1_1", realism=True, o
     
     # Poll for completion
     for _ in range(60):
-        time.sleep(2)
-        status = api_request("GET", f"/v1/ai/mystic/{task_id}")
+        await asyncio.sleep(2)
+        status = await api_request(client, "GET", f"/v1/ai/mystic/{task_id}")
         state = status.get("data", {}).get("status") or status.get("status", "")
         
         if state == "COMPLETED":
@@ -62,7 +86,7 @@ def generate(prompt, resolution="2k", aspect_ratio="square_1_1", realism=True, o
             if images and output:
                 # Download first image
                 img_url = images[0].get("url") or images[0]
-                urllib.request.urlretrieve(img_url, output)
+                await download(client, img_url, output)
                 print(f"Saved to {output}", file=sys.stderr)
             print(json.dumps(status, indent=2))
             return status
@@ -76,6 +100,16 @@ def generate(prompt, resolution="2k", aspect_ratio="square_1_1", realism=True, o
     return None
 
 
+async def generate_many(prompts, outputs=None, **kwargs):
+    """Run several generations concurrently over one client; outputs pairs with prompts."""
+    outputs = outputs or [None] * len(prompts)
+    async with make_client() as client:
+        return await asyncio.gather(*(
+            generate(prompt, output=output, client=client, **kwargs)
+            for prompt, output in zip(prompts, outputs)
+        ))
+
+
 def main():
     parser = argparse.ArgumentParser(description="Generate images via Freepik Mystic")
     parser.add_argument("prompt", help="Image description")
@@ -86,7 +120,7 @@ def main():
     parser.add_argument("-o", "--output", help="Save image to file")
     args = parser.parse_args()
     
-    generate(args.prompt, args.resolution, args.aspect, not args.no_realism, args.output)
+    asyncio.run(generate(args.prompt, args.resolution, args.aspect, not args.no_realism, args.output))
 
 
 if __name__ == "__main__":
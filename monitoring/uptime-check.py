@@ -1,68 +1,117 @@
 #!/usr/bin/env python3
 """Uptime checker for websites. Checks HTTP status, response time, SSL cert expiry."""
 
+import http.client
 import json
 import os
-import socket
 import ssl
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone
-from urllib.request import urlopen, Request
-from urllib.error import URLError, HTTPError
+from urllib.parse import urljoin, urlsplit
 
-SITES = [
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_json import dumps
+
+SITE_URLS = [
     "https://yuzu.chat",
     "https://yuzuhub.com",
     "https://voltplan.app",
 ]
 
+def parse_site(url):
+    """(url, https, hostname, port, path) for one site URL."""
+    parts = urlsplit(url)
+    https = parts.scheme == "https"
+    path = (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+    return (url, https, parts.hostname, parts.port or (443 if https else 80), path)
+
+# Parsed once at import, not per check
+SITES = [parse_site(url) for url in SITE_URLS]
+
 STATE_FILE = os.path.join(os.path.dirname(__file__), "..", "memory", "uptime-state.json")
 
-def check_ssl(hostname):
-    """Check SSL certificate expiry."""
-    try:
-        ctx = ssl.create_default_context()
-        with ctx.wrap_socket(socket.socket(), server_hostname=hostname) as s:
-            s.settimeout(10)
-            s.connect((hostname, 443))
-            cert = s.getpeercert()
-            expires = datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y %Z").replace(tzinfo=timezone.utc)
-            days_left = (expires - datetime.now(timezone.utc)).days
-            return {"valid": True, "expires": expires.isoformat(), "days_left": days_left}
-    except Exception as e:
-        return {"valid": False, "error": str(e)}
+# One context for all sites: loading the CA bundle is the expensive part
+SSL_CTX = ssl.create_default_context()
+
+# Redirects are followed so the final page's status is what gets reported
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+def open_conn(https, hostname, port):
+    """Unconnected HTTP(S) connection for one host."""
+    if https:
+        return http.client.HTTPSConnection(hostname, port, timeout=15, context=SSL_CTX)
+    return http.client.HTTPConnection(hostname, port, timeout=15)
+
+def cert_expiry(cert):
+    """Expiry info from a peer certificate dict."""
+    expires = datetime.strptime(cert["notAfter"], "%b %d %H:%M:%S %Y %Z").replace(tzinfo=timezone.utc)
+    days_left = (expires - datetime.now(timezone.utc)).days
+    return {"valid": True, "expires": expires.isoformat(), "days_left": days_left}
 
-def check_site(url):
-    """Check a single site for availability."""
+def check_site(site):
+    """Check a single site for availability.
+    
+    For HTTPS the certificate is read from the same TLS connection that
+    serves the HTTP request, so each site costs a single handshake.
+    """
+    url, https, hostname, port, path = site
     result = {
         "url": url,
         "timestamp": datetime.now(timezone.utc).isoformat(),
         "ok": False,
     }
     
-    hostname = url.replace("https://", "").replace("http://", "").split("/")[0]
+    conn = open_conn(https, hostname, port)
     
-    # HTTP check
     try:
-        req = Request(url, headers={"User-Agent": "Chadd-Uptime/1.0"})
         start = time.time()
-        resp = urlopen(req, timeout=15)
-        elapsed = round((time.time() - start) * 1000)
-        result["status"] = resp.status
-        result["response_ms"] = elapsed
-        result["ok"] = 200 <= resp.status < 400
-    except HTTPError as e:
-        result["status"] = e.code
-        result["error"] = str(e)
-    except URLError as e:
-        result["error"] = str(e.reason)
-    except Exception as e:
-        result["error"] = str(e)
-    
-    # SSL check
-    if url.startswith("https://"):
-        result["ssl"] = check_ssl(hostname)
+        try:
+            conn.connect()
+        except Exception as e:
+            # Covers DNS/TCP failures and certificate verification errors alike
+            result["error"] = str(e)
+            if https:
+                result["ssl"] = {"valid": False, "error": str(e)}
+            return result
+        
+        # SSL check
+        if https:
+            try:
+                result["ssl"] = cert_expiry(conn.sock.getpeercert())
+            except Exception as e:
+                result["ssl"] = {"valid": False, "error": str(e)}
+        
+        # HTTP check; same-host redirects reuse the connection
+        try:
+            target = url
+            for _ in range(MAX_REDIRECTS + 1):
+                conn.request("GET", path, headers={"User-Agent": "Chadd-Uptime/1.0"})
+                resp = conn.getresponse()
+                resp.read()
+                location = resp.getheader("Location")
+                if resp.status not in REDIRECT_CODES or not location:
+                    break
+                target = urljoin(target, location)
+                _, next_https, next_host, next_port, path = parse_site(target)
+                if (next_https, next_host, next_port) != (https, hostname, port):
+                    conn.close()
+                    https, hostname, port = next_https, next_host, next_port
+                    conn = open_conn(https, hostname, port)
+            else:
+                raise http.client.HTTPException(f"Too many redirects (>{MAX_REDIRECTS}), last: {target}")
+            elapsed = round((time.time() - start) * 1000)
+            result["status"] = resp.status
+            result["response_ms"] = elapsed
+            result["ok"] = 200 <= resp.status < 400
+            if not result["ok"]:
+                result["error"] = f"HTTP Error {resp.status}: {resp.reason}"
+        except Exception as e:
+            result["error"] = str(e)
+    finally:
+        conn.close()
     
     return result
 
@@ -81,14 +130,15 @@ def save_state(state):
         json.dump(state, f, indent=2)
 
 def main():
-    results = []
     alerts = []
     state = load_state()
     
-    for url in SITES:
-        r = check_site(url)
-        results.append(r)
-        
+    # Check all sites in parallel
+    with ThreadPoolExecutor(max_workers=min(32, len(SITES))) as pool:
+        results = list(pool.map(check_site, SITES))
+    
+    for r in results:
+        url = r["url"]
         prev = state.get(url, {})
         was_ok = prev.get("ok", True)
         
@@ -120,7 +170,7 @@ def main():
     
     # Output
     if "--json" in sys.argv:
-        print(json.dumps(results, indent=2))
+        print(dumps(results))
     elif "--quiet" in sys.argv:
         # Only output if there are alerts
         if alerts:
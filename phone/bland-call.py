@@ -2,32 +2,48 @@
 """Bland.ai outbound call script."""
 
 import argparse
+import http.client
 import json
 import os
 import sys
-import requests
+from urllib.parse import urlsplit
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from chadd_env import load_env
 
 # Load from env file
-env_file = os.path.expanduser("~/.chadd-mail.env")
-if os.path.exists(env_file):
-    with open(env_file) as f:
-        for line in f:
-            line = line.strip()
-            if line and not line.startswith("#") and "=" in line:
-                k, v = line.split("=", 1)
-                os.environ.setdefault(k.strip(), v.strip())
+for k, v in load_env().items():
+    os.environ.setdefault(k, v)
 
 API_KEY = os.getenv("BLAND_API_KEY")
 BASE_URL = "https://api.bland.ai/v1"
 
+# Plain stdlib HTTP (requests costs ~40ms just to import). Each run makes a
+# single request, so there is no connection to keep alive.
+_base = urlsplit(BASE_URL)
+BASE_PATH = _base.path
+
+def api_request(method, path, payload=None):
+    """Send a JSON request to Bland.ai; returns (status, parsed body).
+
+    Never retried: a POST /calls that dies after reaching the server may
+    already have placed the call.
+    """
+    body = json.dumps(payload).encode() if payload is not None else None
+    headers = {"Authorization": API_KEY or ""}
+    if body is not None:
+        headers["Content-Type"] = "application/json"
+    conn = http.client.HTTPSConnection(_base.hostname, _base.port or 443, timeout=30)
+    try:
+        conn.request(method, BASE_PATH + path, body, headers)
+        resp = conn.getresponse()
+        return resp.status, json.loads(resp.read() or b"null")
+    finally:
+        conn.close()
+
 def send_call(phone_number, task, language="de", voice="Florian",
               first_sentence=None, wait_for_greeting=True):
     """Send an outbound call via Bland.ai."""
-    headers = {
-        "Authorization": API_KEY,
-        "Content-Type": "application/json"
-    }
-    
     payload = {
         "phone_number": phone_number,
         "task": task,
@@ -40,10 +56,9 @@ def send_call(phone_number, task, language="de", voice="Florian",
     if first_sentence:
         payload["first_sentence"] = first_sentence
     
-    resp = requests.post(f"{BASE_URL}/calls", headers=headers, json=payload)
-    data = resp.json()
+    status, data = api_request("POST", "/calls", payload)
     
-    if resp.status_code == 200 and data.get("status") == "success":
+    if status == 200 and data.get("status") == "success":
         print(f"✅ Call initiated!")
         print(f"   Call ID: {data.get('call_id')}")
         print(f"   Phone: {phone_number}")
@@ -54,9 +69,8 @@ def send_call(phone_number, task, language="de", voice="Florian",
 
 def get_call(call_id):
     """Get call details and transcript."""
-    headers = {"Authorization": API_KEY}
-    resp = requests.get(f"{BASE_URL}/calls/{call_id}", headers=headers)
-    return resp.json()
+    _, data = api_request("GET", f"/calls/{call_id}")
+    return data
 
 def main():
     parser = argparse.ArgumentParser(description="Bland.ai outbound calls")